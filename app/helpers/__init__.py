@@ -1,14 +1,16 @@
-from os import getenv
+from os import environ, getenv
 
 from dotenv import find_dotenv, load_dotenv
 
-# First, load the environment variables from the .env file
-load_dotenv(
-    find_dotenv(
-        # Use the current working directory from where the command is run
-        usecwd=True,
+# First, load the environment variables from the .env file, once per process tree as child processes inherit them
+if not getenv("_DOTENV_LOADED"):
+    load_dotenv(
+        find_dotenv(
+            # Use the current working directory from where the command is run
+            usecwd=True,
+        )
     )
-)
+    environ["_DOTENV_LOADED"] = "true"
 
 # Detect if the code is running in a CI environment
 # See: https://stackoverflow.com/a/75223617
@@ -1,83 +1,111 @@
 import asyncio
-from collections import OrderedDict
+import pickle
 from collections.abc import Awaitable
-from functools import wraps
+from functools import lru_cache as functools_lru_cache, wraps
+from hashlib import blake2b
 
+from diskcache import Cache as DiskCache
 
-def lru_acache(maxsize: int = 128):
+# Marker for a missing value in the persistent cache, as None can be a valid value
+_MISSING = object()
+
+
+class _Slot:
     """
-    Caches an async function's return value each time it is called.
+    Mutable holder for the shared future of a cache key.
 
-    If the maxsize is reached, the least recently used value is removed.
+    The C LRU cannot evict a single key, so a failed future is replaced in place instead.
     """
 
-    def decorator(func):
-        cache: OrderedDict[tuple, Awaitable] = OrderedDict()
+    __slots__ = ("future",)
 
-        @wraps(func)
-        async def wrapper(*args, **kwargs) -> Awaitable:
-            # Create a cache key from event loop, args and kwargs, using frozenset for kwargs to ensure hashability
-            key = (
-                id(asyncio.get_event_loop()),
-                args,
-                frozenset(kwargs.items()),
-            )
+    def __init__(self) -> None:
+        self.future: asyncio.Future | None = None
 
-            if key in cache:
-                # Move the recently accessed key to the end (most recently used)
-                cache.move_to_end(key)
-                return cache[key]
 
-            # Compute the value since it's not cached
-            value = await func(*args, **kwargs)
-            cache[key] = value
-            cache.move_to_end(key)
+def lru_acache(
+    maxsize: int = 128,
+    persist_expire: int | None = None,
+    persist_path: str | None = None,
+):
+    """
+    Caches an async function's return value each time it is called.
 
-            # Remove the least recently used key if the cache is full
-            if len(cache) > maxsize:
-                cache.popitem(last=False)
+    Concurrent calls with the same arguments share the same execution. If the maxsize is reached, the least recently used value is removed.
 
-            return value
+    If a persist path is given, values are also stored on disk and survive process restarts. Arguments and values must be picklable.
+    """
 
-        return wrapper
+    def decorator(func):
+        loop: asyncio.AbstractEventLoop | None = None
 
-    return decorator
+        # One disk cache per decorated function, to open the database only once
+        disk = (
+            DiskCache(
+                directory=persist_path,
+                eviction_policy="least-recently-used",
+            )
+            if persist_path
+            else None
+        )
 
+        async def _compute(*args, **kwargs):
+            if disk is None:
+                return await func(*args, **kwargs)
 
-def lru_cache(maxsize: int = 128):
-    """
-    Caches a sync function's return value each time it is called.
+            # Hash the function and arguments to bound the key size
+            key = blake2b(
+                pickle.dumps((func.__qualname__, args, sorted(kwargs.items())))
+            ).digest()
 
-    If the maxsize is reached, the least recently used value is removed.
-    """
+            # Try the disk, SQLite I/O is blocking
+            value = await asyncio.to_thread(disk.get, key, _MISSING)
+            if value is not _MISSING:
+                return value
 
-    def decorator(func):
-        cache: OrderedDict[tuple, Awaitable] = OrderedDict()
+            # Compute and persist the value
+            value = await func(*args, **kwargs)
+            await asyncio.to_thread(disk.set, key, value, expire=persist_expire)
+            return value
+
+        # Keys are built and stored by the C implementation, only the slot is allocated on miss
+        @functools_lru_cache(maxsize=maxsize)
+        def _slot(*_args, **_kwargs) -> _Slot:
+            return _Slot()
 
         @wraps(func)
-        def wrapper(*args, **kwargs) -> Awaitable:
-            # Create a cache key from args and kwargs, using frozenset for kwargs to ensure hashability
-            key = (
-                args,
-                frozenset(kwargs.items()),
-            )
+        async def wrapper(*args, **kwargs) -> Awaitable:
+            nonlocal loop
 
-            if key in cache:
-                # Move the recently accessed key to the end (most recently used)
-                cache.move_to_end(key)
-                return cache[key]
+            # Futures are bound to a loop, reset the cache if the loop changed
+            running_loop = asyncio.get_running_loop()
+            if running_loop is not loop:
+                _slot.cache_clear()
+                loop = running_loop
 
-            # Compute the value since it's not cached
-            value = func(*args, **kwargs)
-            cache[key] = value
-            cache.move_to_end(key)
+            slot = _slot(*args, **kwargs)
+            future = slot.future
 
-            # Remove the least recently used key if the cache is full
-            if len(cache) > maxsize:
-                cache.popitem(last=False)
+            # Compute the value if not cached, or if the previous execution failed
+            if (
+                future is None
+                or future.cancelled()
+                or (future.done() and future.exception())
+            ):
+                future = slot.future = asyncio.ensure_future(_compute(*args, **kwargs))
 
-            return value
+            # Shield the shared execution from the cancellation of a single caller
+            return await asyncio.shield(future)
 
         return wrapper
 
     return decorator
+
+
+def lru_cache(maxsize: int = 128):
+    """
+    Caches a sync function's return value each time it is called.
+
+    If the maxsize is reached, the least recently used value is removed.
+    """
+    return functools_lru_cache(maxsize=maxsize)
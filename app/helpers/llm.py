@@ -1,14 +1,24 @@
 import asyncio
 from collections.abc import Awaitable, Callable
-from json import loads
+from functools import partial
+from hashlib import blake2b
+from inspect import isawaitable
+from os import getenv
 from textwrap import dedent
-from typing import TypeVar
+from types import CodeType
+from typing import Any, TypedDict, TypeVar
 
 import litellm
 from crawl4ai import AsyncWebCrawler, CacheMode, CrawlerRunConfig, CrawlResult
 from diskcache import Cache as DiskCache
-from litellm import ChatCompletionMessageToolCall, Choices, acompletion
+from litellm import (
+    ChatCompletionMessageToolCall,
+    Choices,
+    CustomStreamWrapper,
+    acompletion,
+)
 from litellm.files.main import ModelResponse
+from litellm.litellm_core_utils.get_llm_provider_logic import get_llm_provider
 from litellm.types.caching import LiteLLMCacheType
 from litellm.types.completion import (
     ChatCompletionAssistantMessageParam,
@@ -16,23 +26,42 @@ from litellm.types.completion import (
     ChatCompletionToolMessageParam,
     ChatCompletionUserMessageParam,
 )
-from litellm.types.utils import Message
+from litellm.types.llms.openai import (
+    ChatCompletionSystemMessage,
+    ChatCompletionTextObject,
+)
+from litellm.types.utils import Message, Usage as LitellmUsage
 from litellm.utils import function_to_dict, token_counter
-from pydantic import BaseModel, TypeAdapter, ValidationError
+from orjson import OPT_SORT_KEYS, JSONDecodeError, dumps, loads
+from pydantic import BaseModel, ValidationError, create_model
 
+from app.helpers.cache import lru_cache
 from app.helpers.logging import logger
 from app.models.chat_completion import (
     Usage,
 )
 
 # Type hints
-MessagesList = list[
+AnyMessage = (
     Message
+    | ChatCompletionSystemMessage
     | ChatCompletionSystemMessageParam
     | ChatCompletionUserMessageParam
     | ChatCompletionAssistantMessageParam
     | ChatCompletionToolMessageParam
-]
+)
+MessagesList = list[AnyMessage]
+
+
+class CompletionKwargs(TypedDict):
+    """
+    Sampling parameters, shared by all completions of a request.
+    """
+
+    model: str
+    temperature: float
+    top_p: float
+
 
 # Enable Litellm cache
 litellm.enable_cache(
@@ -46,13 +75,41 @@ CRAWL_CONFIG = CrawlerRunConfig(
     verbose=False,
 )
 CRAWL_CACHE = DiskCache(".crawl4ai_cache")
+CRAWL_CACHE_EXPIRE = 60 * 60 * 24 * 7  # 7 days
+# Answers following tool calls, to skip the second completion of a tool call
+# Opt-in, as a reused answer is not sampled again
+POST_TOOL_CACHE_ENABLED = getenv("POST_TOOL_CACHE_ENABLED", "").lower() == "true"
+# Answers are built on read web pages, don't keep them longer
+POST_TOOL_CACHE_EXPIRE = CRAWL_CACHE_EXPIRE
+# Shared browser, started and closed with the app lifespan
+CRAWLER = AsyncWebCrawler()
+# Reads in progress, to coalesce concurrent reads of the same URL with the same model, with the synthesis and its usage
+_READ_URL_INFLIGHT: dict[
+    tuple[str, float, float, str], asyncio.Future[tuple[str, Usage]]
+] = {}
 
 # Type validation
 P = TypeVar("P", bound=bool | float | int | str | BaseModel)
 T = TypeVar("T")
 
 # LLM
+MAX_SIMULTANEOUS_COMPLETIONS = 20
 MAX_SIMULTANEOUS_TOOLS = 5
+# Providers requiring explicit markers for prompt caching
+CACHE_CONTROL_PROVIDERS = {"anthropic"}
+MAX_TOKEN_COUNTS = 4096
+
+# Throttle completions across requests, to stay under the provider rate limits
+_COMPLETIONS_SEMAPHORE = asyncio.Semaphore(MAX_SIMULTANEOUS_COMPLETIONS)
+# Throttle tools, so all calls are executed but only a few at a time
+_TOOLS_SEMAPHORE = asyncio.Semaphore(MAX_SIMULTANEOUS_TOOLS)
+
+# Tool schemas, by definition as tools are re-created on each call
+_TOOL_SCHEMAS: dict[CodeType | type, dict[str, Any]] = {}
+_TOOLS_SCHEMAS: dict[tuple[CodeType | type, ...], list[dict[str, Any]]] = {}
+
+# Token counts, by model and text digest so the texts are not kept in memory
+_TOKEN_COUNTS: dict[tuple[str, bytes], int] = {}
 
 
 class CompletionException(Exception):
@@ -71,44 +128,31 @@ async def non_empty_completion(  # noqa: PLR0913
     usage: Usage,
     json: bool = False,
     existing_history: MessagesList = [],
+    system_context: str = "",
     tools: list[Callable[..., Awaitable[str]]] = [],
 ) -> str:
     """
     Ask a LLM to generate a type from a LLM.
 
     Returns None if the response is invalid or empty.
-    """
-    # Explicit the response type in the system message
-    system = f"""
-        {dedent(system)}
 
-        # Response format
-        string
+    System prompt should be static, so providers can cache it. Request specific information goes into the context, sent after it.
     """
+    # Explicit the response type in the system message
+    system = _system_prompt(system, None)
 
-    def _validate(
-        req: str | None,
-    ) -> str:
-        """
-        Validate the string, make sure it is not empty.
-        """
-        # Raise if empty response
-        if not req:
-            raise ValidationException("Empty response")
-
-        return req
-
-    # Ask LLM
+    # Ask LLM, history is copied once as it is extended in place
     return await _raw_completion(
-        existing_history=existing_history,
+        history=list(existing_history),
         json=json,
         model=model,
         system=system,
+        system_context=dedent(system_context).strip(),
         temperature=temperature,
         tools=tools,
         top_p=top_p,
         usage=usage,
-        validation_callback=_validate,
+        validation_callback=_validate_non_empty,
     )
 
 
@@ -120,88 +164,205 @@ async def validated_completion(  # noqa: PLR0913
     top_p: float,
     usage: Usage,
     existing_history: MessagesList = [],
+    system_context: str = "",
     tools: list[Callable[..., Awaitable[str]]] = [],
 ) -> P:
     """
     Ask a LLM to generate a type from a LLM.
 
     Returns None if the response is invalid or empty.
-    """
-
-    class _Native(BaseModel):
-        value: P
-
-    def _validate(
-        req: str | None,
-    ) -> P:
-        """
-        Validate the response, make sure it is not empty and is of the expected type.
-
-        Type is either a Pydantic model or a Python native type.
-        """
-        # Raise if empty response
-        if not req:
-            raise ValidationException("Empty response")
-
-        # Return as is if matching type
-        if isinstance(req, res_type):
-            return req
-
-        # Validate a Pydantic model
-        if issubclass(res_type, BaseModel):
-            # Validate JSON
-            try:
-                return res_type.model_validate_json(req)
-            # Pydantic validation error
-            except ValidationError as e:
-                raise ValidationException(
-                    e.json(
-                        # Lower LLM response size and API cost
-                        include_input=False,
-                        include_url=False,
-                    )
-                )
 
-        # Validate a native type
-        try:
-            return TypeAdapter(_Native).validate_python(req).value
-        # Pydantic validation error
-        except ValidationError as e:
-            raise ValidationException(
-                e.json(
-                    # Lower LLM response size and API cost
-                    include_input=False,
-                    include_url=False,
-                )
-            )
+    System prompt should be static, so providers can cache it. Request specific information goes into the context, sent after it.
+    """
 
     # System prompt with the response schema
-    system = f"""
-        {system}
-
-        # Response JSON schema
-        {res_type.model_json_schema() if issubclass(res_type, BaseModel) else _Native.model_json_schema()}
-    """
+    system = _system_prompt(system, res_type)
 
-    # Ask LLM
+    # Ask LLM, history is copied once as it is extended in place
     return await _raw_completion(
-        existing_history=existing_history,
+        history=list(existing_history),
         json=True,
         model=model,
         system=system,
+        system_context=dedent(system_context).strip(),
         temperature=temperature,
         tools=tools,
         top_p=top_p,
         usage=usage,
-        validation_callback=_validate,
+        validation_callback=partial(_validate_type, res_type),
+    )
+
+
+async def early_stop_completion(  # noqa: PLR0913
+    model: str,
+    stop_prefix: str,
+    system: str,
+    temperature: float,
+    top_p: float,
+    usage: Usage,
+    existing_history: MessagesList = [],
+    system_context: str = "",
+) -> str:
+    """
+    Ask a LLM to generate a string, stopping as soon as it starts with a prefix.
+
+    Response is streamed, so a response starting with the prefix is returned without waiting for the rest of it. Prefix is matched case insensitive, ignoring leading quotes and spaces.
+
+    Exception is raised if the response failed or is empty.
+    """
+    # Explicit the response type in the system message
+    system = _system_prompt(system, None)
+
+    # Build history for the request
+    sent_history: MessagesList = [
+        _system_message(
+            model=model,
+            system=system,
+            system_context=dedent(system_context).strip(),
+        ),
+        *existing_history,
+    ]  # History + system message
+
+    content = ""
+    finish_reason = None
+    res_usage: LitellmUsage | None = None
+    stop_prefix = stop_prefix.lower()
+    async with _COMPLETIONS_SEMAPHORE:
+        res: CustomStreamWrapper = await acompletion(
+            caching=True,  # Use Litellm cache
+            messages=sent_history,
+            model=model,
+            seed=42,  # Enhance reproducibility
+            stream=True,
+            stream_options={"include_usage": True},  # Usage is sent in the last chunk
+            temperature=temperature,
+            top_p=top_p,
+        )  # pyright: ignore[reportAssignmentType]
+
+        try:
+            async for chunk in res:
+                res_usage = getattr(chunk, "usage", None) or res_usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                content += choice.delta.content or ""
+                finish_reason = choice.finish_reason or finish_reason
+
+                # Stop as soon as the prefix is received
+                head = content.lstrip(" \n\"'").lower()
+                if head.startswith(stop_prefix):
+                    logger.debug("LLM response starts with stop prefix, stopping")
+                    finish_reason = "stop"
+                    break
+        finally:
+            # Close the connection, so the provider stops generating
+            await _close_stream(res)
+
+    # Usage is not sent if the stream is stopped, estimate it
+    _update_usage(
+        completion=ChatCompletionAssistantMessageParam(
+            content=content,
+            role="assistant",
+        ),
+        model=model,
+        res_usage=res_usage,
+        sent_history=sent_history,
+        usage=usage,
+    )
+
+    # Alert if response is truncated
+    if finish_reason == "length":
+        logger.warning("LLM response truncated")
+    # Raise if response failed
+    elif finish_reason != "stop":
+        raise CompletionException(
+            f"Completion did not finish correctly: {finish_reason}"
+        )
+
+    # Raise if no content
+    if not content:
+        raise CompletionException("Completion message is empty")
+
+    return content
+
+
+async def _close_stream(res: CustomStreamWrapper) -> None:
+    """
+    Close a completion stream.
+
+    Litellm does not expose it, the underlying stream is either an async generator or an OpenAI stream.
+    """
+    stream = getattr(res, "completion_stream", None)
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if close:
+        closed = close()
+        if isawaitable(closed):
+            await closed
+
+
+def _validate_non_empty(
+    req: str | None,
+) -> str:
+    """
+    Validate the string, make sure it is not empty.
+    """
+    # Raise if empty response
+    if not req:
+        raise ValidationException("Empty response")
+
+    return req
+
+
+def _validate_type(
+    res_type: type[P],
+    req: str | None,
+) -> P:
+    """
+    Validate the response, make sure it is not empty and is of the expected type.
+
+    Type is either a Pydantic model or a Python native type.
+    """
+    # Raise if empty response
+    if not req:
+        raise ValidationException("Empty response")
+
+    # Return as is if matching type
+    if isinstance(req, res_type):
+        return req
+
+    # Validate a Pydantic model, or a native type wrapped in a model
+    try:
+        if issubclass(res_type, BaseModel):
+            return res_type.model_validate_json(req)
+        return _native_model(res_type).model_validate_json(req).value  # pyright: ignore[reportAttributeAccessIssue]
+    # Pydantic validation error
+    except ValidationError as e:
+        raise ValidationException(
+            e.json(
+                # Lower LLM response size and API cost
+                include_input=False,
+                include_url=False,
+            )
+        )
+
+
+@lru_cache(maxsize=128)
+def _native_model(res_type: type) -> type[BaseModel]:
+    """
+    Get a model wrapping a Python native type, to validate it.
+    """
+    return create_model(
+        "_Native",
+        value=(res_type, ...),
     )
 
 
 async def _raw_completion(  # noqa: PLR0913
-    existing_history: MessagesList,
+    history: MessagesList,
     json: bool,
     model: str,
     system: str,
+    system_context: str,
     temperature: float,
     tools: list[Callable[..., Awaitable[str]]],
     top_p: float,
@@ -215,21 +376,17 @@ async def _raw_completion(  # noqa: PLR0913
     Get a response from the LLM.
 
     Exception is raised if the response is truncated or empty.
+
+    History is extended in place with the tool calls and the validation retries, across recursions.
     """
-    local_history = existing_history.copy()
-    system_message = ChatCompletionSystemMessageParam(
-        content=dedent(system),
-        role="system",
+    system_message = _system_message(
+        model=model,
+        system=system,
+        system_context=system_context,
     )
 
     # Convert functions to expected API schema
-    tools_dict = [
-        {
-            "type": "function",
-            "function": function_to_dict(tool),
-        }
-        for tool in tools
-    ]
+    tools_dict = _tools_schema(tools)
 
     # Add previous result and validation error
     if _validation_error:
@@ -239,7 +396,7 @@ async def _raw_completion(  # noqa: PLR0913
 
         # Add previous result if available
         if _previous_result:
-            local_history.append(
+            history.append(
                 ChatCompletionAssistantMessageParam(
                     content=_previous_result,
                     role="assistant",
@@ -247,7 +404,7 @@ async def _raw_completion(  # noqa: PLR0913
             )
 
         # Add validation error
-        local_history.append(
+        history.append(
             ChatCompletionUserMessageParam(
                 content=f"A validation error occurred, please retry: {_validation_error}",
                 role="user",
@@ -257,64 +414,81 @@ async def _raw_completion(  # noqa: PLR0913
     # Build history for the request
     sent_history: MessagesList = [
         system_message,
-        *local_history,
+        *history,
     ]  # History + system message
 
-    res: ModelResponse = await acompletion(
-        caching=True,  # Use Litellm cache
-        messages=sent_history,
-        model=model,
-        response_format={"type": "json_object"} if json else None,
-        seed=42,  # Enhance reproducibility
-        temperature=temperature,
-        tools=tools_dict,
-        top_p=top_p,
-    )  # pyright: ignore[reportAssignmentType]
+    async with _COMPLETIONS_SEMAPHORE:
+        res: ModelResponse = await acompletion(
+            caching=True,  # Use Litellm cache
+            messages=sent_history,
+            model=model,
+            response_format={"type": "json_object"} if json else None,
+            seed=42,  # Enhance reproducibility
+            temperature=temperature,
+            tools=tools_dict,
+            top_p=top_p,
+        )  # pyright: ignore[reportAssignmentType]
     choice: Choices = res.choices[0]  # pyright: ignore[reportAssignmentType]
 
     # Update usage
-    # TODO: Consumption is not accurate at all with that method, use data from the response
-    usage.completion_tokens += token_counter(
-        messages=[choice.message.model_dump()],
+    _update_usage(
+        completion=choice.message,
         model=model,
-    )  # Increment completion from the response string
-    usage.prompt_tokens += token_counter(
-        messages=[
-            message.model_dump() if isinstance(message, BaseModel) else message
-            for message in sent_history
-        ],
-        model=model,
-    )  # Increment prompt from the request objects
+        res_usage=getattr(res, "usage", None),
+        sent_history=sent_history,
+        usage=usage,
+    )
 
     # Check for tools
     tool_calls = choice.message.tool_calls
     if tool_calls:
         # List available functions
-        available_functions = {function.__name__: function for function in tools}
-
-        # Extend conversation with assistant's reply
-        local_history.append(choice.message)
-
-        # Execute tools and add them to history
-        local_history.extend(
-            await asyncio.gather(
-                *[
-                    _execute_tool(
-                        available_functions=available_functions,
-                        position=i,
-                        tool_call=tool_call,
-                    )
-                    for i, tool_call in enumerate(tool_calls)
-                ]
+        available_functions = {_tool_name(function): function for function in tools}
+
+        # Execute tools
+        tool_messages = await asyncio.gather(
+            *[
+                _execute_tool(
+                    available_functions=available_functions,
+                    tool_call=tool_call,
+                )
+                for tool_call in tool_calls
+            ]
+        )
+
+        # Reuse the answer to the same tool results, tools are executed anyway for their side effects
+        post_tool_key = (
+            _post_tool_cache_key(
+                history=history,
+                json=json,
+                model=model,
+                system=system,
+                system_context=system_context,
+                tool_calls=tool_calls,
+                tool_messages=tool_messages,
             )
+            if POST_TOOL_CACHE_ENABLED
+            else None
         )
+        if post_tool_key is not None:
+            post_tool_cached: T | None = await asyncio.to_thread(
+                _post_tool_cache().get, post_tool_key
+            )  # pyright: ignore[reportAssignmentType]
+            if post_tool_cached is not None:
+                logger.debug("Post-tool cache hit")
+                return post_tool_cached
+
+        # Extend conversation with assistant's reply and tool results
+        history.append(choice.message)
+        history.extend(tool_messages)
 
         # Re-run the completion with the tool results
-        return await _raw_completion(
-            existing_history=local_history,
+        validated = await _raw_completion(
+            history=history,
             json=json,
             model=model,
             system=system,
+            system_context=system_context,
             temperature=temperature,
             tools=[],  # Don't execute tools twice
             top_p=top_p,
@@ -325,6 +499,16 @@ async def _raw_completion(  # noqa: PLR0913
             _validation_error=_validation_error,
         )
 
+        # Update post-tool cache, SQLite I/O is blocking
+        if post_tool_key is not None:
+            await asyncio.to_thread(
+                _post_tool_cache().set,
+                expire=POST_TOOL_CACHE_EXPIRE,
+                key=post_tool_key,
+                value=validated,
+            )
+        return validated
+
     finish_reason = choice.finish_reason
     # Alert if response is truncated
     if finish_reason == "length":
@@ -340,9 +524,9 @@ async def _raw_completion(  # noqa: PLR0913
     if not content:
         raise CompletionException("Completion message is empty")
 
-    # Return parsed content
+    # Parse content
     try:
-        return validation_callback(content)
+        validated = validation_callback(content)
 
     # Retry if validation failed
     except ValidationException as e:
@@ -359,10 +543,11 @@ async def _raw_completion(  # noqa: PLR0913
             "LLM validation error, retrying (%i retries left)", _retries_remaining
         )
         return await _raw_completion(
-            existing_history=local_history,
+            history=history,
             json=json,
             model=model,
             system=system,
+            system_context=system_context,
             temperature=temperature,
             tools=tools,
             top_p=top_p,
@@ -373,10 +558,237 @@ async def _raw_completion(  # noqa: PLR0913
             _validation_error=validation_error,
         )
 
+    return validated
+
+
+@lru_cache(maxsize=128)
+def _system_prompt(system: str, res_type: type | None) -> str:
+    """
+    Build the static system prompt, with the expected response format.
+
+    System prompts are mostly constants, so they are dedented and formatted once.
+    """
+    if res_type is None:
+        return f"{dedent(system).strip()}\n\n# Response format\nstring"
+    return f"{dedent(system).strip()}\n\n# Response JSON schema\n{_schema_prompt(res_type)}"
+
+
+@lru_cache(maxsize=128)
+def _schema_prompt(res_type: type) -> str:
+    """
+    Get the JSON schema of a response type, for the system prompt.
+
+    Schema is canonicalized to keep the prompt byte-stable.
+    """
+    return dumps(
+        res_type.model_json_schema()
+        if issubclass(res_type, BaseModel)
+        else _native_model(res_type).model_json_schema(),
+        option=OPT_SORT_KEYS,
+    ).decode()
+
+
+def _system_message(
+    model: str,
+    system: str,
+    system_context: str,
+) -> ChatCompletionSystemMessage | ChatCompletionSystemMessageParam:
+    """
+    Build the system message, first of the conversation.
+
+    Static prompt comes first, so the prefix matches the provider prompt cache across requests. If the provider requires it, only the static prompt is marked as cacheable.
+    """
+    if _provider(model) in CACHE_CONTROL_PROVIDERS:
+        content = [
+            ChatCompletionTextObject(
+                cache_control={"type": "ephemeral"},
+                text=system,
+                type="text",
+            ),
+        ]
+        if system_context:
+            content.append(
+                ChatCompletionTextObject(
+                    text=system_context,
+                    type="text",
+                )
+            )
+        return ChatCompletionSystemMessage(
+            content=content,
+            role="system",
+        )
+
+    return ChatCompletionSystemMessageParam(
+        content=f"{system}\n\n{system_context}" if system_context else system,
+        role="system",
+    )
+
+
+def _tools_schema(tools: list[Callable[..., Awaitable[str]]]) -> list[dict[str, Any]]:
+    """
+    Get the API schema of a list of tools.
+
+    Tools are built per call but their definitions are static, so the list is built once per set of definitions and shared across calls.
+    """
+    key = tuple(_tool_key(tool) for tool in tools)
+    schemas = _TOOLS_SCHEMAS.get(key)
+    if schemas is None:
+        schemas = _TOOLS_SCHEMAS[key] = [_tool_schema(tool) for tool in tools]
+    return schemas
+
+
+def _tool_schema(tool: Callable[..., Awaitable[str]]) -> dict[str, Any]:
+    """
+    Get the API schema of a tool.
+
+    Schema is built from the function signature and docstring, so it is introspected once per tool definition. Callable objects are described by their call method.
+    """
+    key = _tool_key(tool)
+    schema = _TOOL_SCHEMAS.get(key)
+    if schema is None:
+        function = function_to_dict(
+            tool if isinstance(key, CodeType) else tool.__call__
+        )
+        function["name"] = _tool_name(tool)
+        schema = _TOOL_SCHEMAS[key] = {
+            "type": "function",
+            "function": function,
+        }
+    return schema
+
+
+def _tool_key(tool: Callable[..., Awaitable[str]]) -> CodeType | type:
+    """
+    Identify the definition of a tool.
+
+    Functions are identified by their code object, as closures are re-created on each call. Callable objects by their class.
+    """
+    code: CodeType | None = getattr(tool, "__code__", None)
+    return code if code is not None else type(tool)
+
+
+def _tool_name(tool: Callable[..., Awaitable[str]]) -> str:
+    """
+    Get the name of a tool, as exposed to the LLM.
+    """
+    return getattr(tool, "__name__", None) or type(tool).__name__
+
+
+def _update_usage(
+    completion: AnyMessage,
+    model: str,
+    res_usage: LitellmUsage | None,
+    sent_history: MessagesList,
+    usage: Usage,
+) -> None:
+    """
+    Add the consumption of a completion to the usage.
+
+    Consumption reported by the provider is used if available, else it is estimated.
+    """
+    if res_usage:
+        usage.completion_tokens += res_usage.completion_tokens
+        usage.prompt_tokens += res_usage.prompt_tokens
+        details = res_usage.prompt_tokens_details
+        if details and details.cached_tokens:
+            usage.prompt_tokens_details.cached_tokens += details.cached_tokens
+        return
+
+    # Counts are cached per message, as the history is mostly replayed between calls
+    usage.completion_tokens += _count_tokens(model, _message_text(completion))
+    usage.prompt_tokens += sum(
+        _count_tokens(model, _message_text(message)) for message in sent_history
+    )
+
+
+def _count_tokens(model: str, text: str) -> int:
+    """
+    Count the tokens of a text, with the model tokenizer.
+
+    Counts are cached by the text digest. If the cache is full, the oldest count is removed.
+    """
+    key = (model, blake2b(text.encode()).digest())
+    count = _TOKEN_COUNTS.get(key)
+    if count is None:
+        # Remove the oldest count if the cache is full
+        if len(_TOKEN_COUNTS) >= MAX_TOKEN_COUNTS:
+            del _TOKEN_COUNTS[next(iter(_TOKEN_COUNTS))]
+        count = _TOKEN_COUNTS[key] = token_counter(
+            model=model,
+            text=text,
+        )
+    return count
+
+
+def _message_text(message: AnyMessage) -> str:
+    """
+    Serialize a message, to count its tokens.
+    """
+    return dumps(
+        message.model_dump() if isinstance(message, BaseModel) else message
+    ).decode()
+
+
+@lru_cache()
+def _provider(model: str) -> str:
+    """
+    Get the LLM provider from the model name.
+    """
+    return get_llm_provider(model)[1]
+
+
+@lru_cache(maxsize=1)
+def _post_tool_cache() -> DiskCache:
+    """
+    Get the post-tool cache.
+
+    Cache is opened on first use, so its directory is not created if disabled.
+    """
+    return DiskCache(".post_tool_cache")
+
+
+def _post_tool_cache_key(  # noqa: PLR0913
+    history: MessagesList,
+    json: bool,
+    model: str,
+    system: str,
+    system_context: str,
+    tool_calls: list[ChatCompletionMessageToolCall],
+    tool_messages: list[ChatCompletionToolMessageParam],
+) -> bytes:
+    """
+    Build the post-tool cache key of a completion.
+
+    Tool call IDs are generated on each response, so tool calls are identified by their name, arguments and result.
+    """
+    return blake2b(
+        dumps(
+            [
+                model,
+                json,
+                system,
+                system_context,
+                [
+                    message.model_dump() if isinstance(message, BaseModel) else message
+                    for message in history
+                ],
+                sorted(
+                    [
+                        tool_call.function.name,
+                        tool_call.function.arguments,
+                        tool_message["content"],
+                    ]
+                    for tool_call, tool_message in zip(
+                        tool_calls, tool_messages, strict=True
+                    )
+                ),
+            ]
+        )
+    ).digest()
+
 
 async def _execute_tool(
     available_functions: dict[str, Callable[..., Awaitable[str]]],
-    position: int,
     tool_call: ChatCompletionMessageToolCall,
 ) -> ChatCompletionToolMessageParam:
     # Skip if no function name
@@ -396,24 +808,17 @@ async def _execute_tool(
             tool_call_id=tool_call.id,
         )
 
-    # Skip if too many tools
-    if position >= MAX_SIMULTANEOUS_TOOLS:
-        return ChatCompletionToolMessageParam(
-            content=f"Too many tools called at once (limit is {MAX_SIMULTANEOUS_TOOLS}).",
-            role="tool",
-            tool_call_id=tool_call.id,
-        )
-
     # Execute
     logger.debug("Executing tool: %s", function_name)
     function_to_call = available_functions[function_name]
 
     # Try parse arguments and execute
     try:
-        function_response = await function_to_call(
-            **loads(tool_call.function.arguments)
-        )
-    except TypeError as e:
+        async with _TOOLS_SEMAPHORE:
+            function_response = await function_to_call(
+                **loads(tool_call.function.arguments)
+            )
+    except (JSONDecodeError, TypeError) as e:
         logger.debug("Tool execution failed: %s", e)
         return ChatCompletionToolMessageParam(
             content=f"Bad arguments: {e}",
@@ -434,33 +839,31 @@ def read_url_tool(
     top_p: float,
     usage: Usage,
 ) -> Callable[..., Awaitable[str]]:
-    async def _read_url(
+    async def _read(
+        key: tuple[str, float, float, str],
         url: str,
-    ) -> str:
-        """
-        Read a URL and return the content.
+    ) -> tuple[str, Usage]:
+        # Usage of this read only, to be charged to every request sharing it
+        read_usage = Usage()
 
-        Content is cached for 7 days and is an analysis of the raw web page.
-        """
-        # Try cache
-        cache_key = url
-        cache = CRAWL_CACHE.get(cache_key)
+        # Try cache, SQLite I/O is blocking
+        cache_key = key
+        cache = await asyncio.to_thread(CRAWL_CACHE.get, cache_key)
         if cache:
-            return cache  # pyright: ignore[reportReturnType]
+            return cache, read_usage  # pyright: ignore[reportReturnType]
 
         # Scrape
-        async with AsyncWebCrawler() as crawler:
-            result: CrawlResult = await crawler.arun(
-                config=CRAWL_CONFIG,
-                url=url,
-            )  # pyright: ignore[reportAssignmentType]
+        result: CrawlResult = await CRAWLER.arun(
+            config=CRAWL_CONFIG,
+            url=url,
+        )  # pyright: ignore[reportAssignmentType]
         content = str(result.markdown)
 
         synthesis = await non_empty_completion(
             model=model,
             temperature=temperature,
             top_p=top_p,
-            usage=usage,
+            usage=read_usage,
             existing_history=[
                 ChatCompletionUserMessageParam(
                     content=content,
@@ -480,13 +883,41 @@ def read_url_tool(
         )
 
         # Update cache
-        CRAWL_CACHE.set(
-            expire=60 * 60 * 24 * 7,  # 7 days
+        await asyncio.to_thread(
+            CRAWL_CACHE.set,
+            expire=CRAWL_CACHE_EXPIRE,
             key=cache_key,
             value=synthesis,
         )
 
         # logger.debug("Parsed URL %s: %s", url, synthesis)
+        return synthesis, read_usage
+
+    async def _read_url(
+        url: str,
+    ) -> str:
+        """
+        Read a URL and return the content.
+
+        Content is cached for 7 days and is an analysis of the raw web page.
+        """
+        # Join the read in progress for the same URL and model, if any
+        # Synthesis depends on the model, so reads are cached and coalesced by the same key
+        key = (model, temperature, top_p, url)
+        future = _READ_URL_INFLIGHT.get(key)
+        if not future:
+            future = _READ_URL_INFLIGHT[key] = asyncio.ensure_future(_read(key, url))
+            future.add_done_callback(lambda _: _READ_URL_INFLIGHT.pop(key, None))
+
+        # Shield the shared read from the cancellation of a single caller
+        synthesis, read_usage = await asyncio.shield(future)
+
+        # Charge the synthesis to the request
+        usage.completion_tokens += read_usage.completion_tokens
+        usage.prompt_tokens += read_usage.prompt_tokens
+        usage.prompt_tokens_details.cached_tokens += (
+            read_usage.prompt_tokens_details.cached_tokens
+        )
         return synthesis
 
     return _read_url
@@ -1,7 +1,11 @@
+import sys
 from logging import DEBUG, INFO, Logger
 from os import getenv
 
+from orjson import dumps
 from structlog import (
+    BytesLoggerFactory,
+    PrintLoggerFactory,
     configure,
     configure_once,
     get_logger as structlog_get_logger,
@@ -10,17 +14,23 @@ from structlog import (
 from structlog.contextvars import merge_contextvars
 from structlog.dev import ConsoleRenderer
 from structlog.processors import (
+    ExceptionRenderer,
+    JSONRenderer,
     StackInfoRenderer,
     TimeStamper,
     UnicodeDecoder,
     add_log_level,
 )
 from structlog.stdlib import PositionalArgumentsFormatter
+from structlog.tracebacks import ExceptionDictTransformer
 
 from app.helpers import IS_CI
 
 VERSION = getenv("VERSION", "0.0.0-unknown")
 
+# Pretty print only for humans, JSON is cheaper to render and to ingest in log sinks
+IS_TTY = sys.stdout.isatty()
+
 
 def enable_debug_logging() -> None:
     configure(
@@ -31,6 +41,7 @@ def enable_debug_logging() -> None:
 configure_once(
     cache_logger_on_first_use=True,
     context_class=dict,
+    logger_factory=PrintLoggerFactory() if IS_TTY else BytesLoggerFactory(),
     wrapper_class=make_filtering_bound_logger(INFO),
     processors=[
         # Add contextvars support
@@ -45,8 +56,16 @@ configure_once(
         StackInfoRenderer(),
         # Decode Unicode to str
         UnicodeDecoder(),
-        # Pretty printing in a terminal session
-        ConsoleRenderer(),
+        # Pretty printing in a terminal session, JSON lines otherwise
+        *(
+            [ConsoleRenderer()]
+            if IS_TTY
+            else [
+                # Without locals, they hold the user messages and the gathered knowledge
+                ExceptionRenderer(ExceptionDictTransformer(show_locals=False)),
+                JSONRenderer(serializer=dumps),
+            ]
+        ),
     ],
 )
 
@@ -0,0 +1,179 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from hashlib import blake2b
+from math import sqrt, sumprod
+from os import getenv
+
+from diskcache import Cache as DiskCache
+from litellm import aembedding
+
+from app.helpers.logging import logger
+
+# Opt-in, as a similar prompt can be answered with a wrong response
+SEMANTIC_CACHE_ENABLED = getenv("SEMANTIC_CACHE_ENABLED", "").lower() == "true"
+SEMANTIC_CACHE_MODEL = getenv("SEMANTIC_CACHE_MODEL", "text-embedding-3-small")
+SEMANTIC_CACHE_THRESHOLD = float(getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+
+# Entries
+MAX_ENTRIES_PER_NAMESPACE = 64
+MAX_NAMESPACES_IN_MEMORY = 1024
+ENTRIES_EXPIRE = 60 * 60 * 24 * 7  # 7 days
+
+# Type hints
+Embedding = list[float]
+
+
+class SemanticCache:
+    """
+    Cache of LLM responses, matched by the cosine similarity of the prompt embeddings.
+
+    Entries are grouped by namespace, which holds everything that must match exactly (model, system prompt, etc). Only the text is matched semantically.
+
+    Entries are persisted on disk, and loaded in memory on the first use of a namespace. The disk store is opened on first use, so its directory is not created if disabled.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        enabled: bool,
+        model: str,
+        threshold: float,
+    ) -> None:
+        self._directory = directory
+        self._disk_cache: DiskCache | None = None
+        self._enabled = enabled
+        self._entries: dict[str, list[tuple[Embedding, str]]] = {}
+        self._model = model
+        self._threshold = threshold
+
+    async def get_or_compute(
+        self,
+        compute: Callable[[], Awaitable[str]],
+        namespace: str,
+        text: str,
+        should_store: Callable[[str], bool] | None = None,
+    ) -> str:
+        """
+        Get the response of a text, or compute and store it.
+
+        The same text is matched exactly first, without embedding it. Then, the closest similar text is used. If the cache is disabled, the response is always computed.
+
+        If a store check is given, only the computed responses passing it are stored.
+        """
+        if not self._enabled:
+            return await compute()
+
+        # Hash to bound the key size
+        namespace = blake2b(namespace.encode()).hexdigest()
+        exact_key = f"{namespace}:{blake2b(text.encode()).hexdigest()}"
+
+        # Try the exact match, SQLite I/O is blocking
+        value: str | None = await asyncio.to_thread(self._disk.get, exact_key)  # pyright: ignore[reportAssignmentType]
+        if value is not None:
+            logger.debug("Semantic cache exact hit")
+            return value
+
+        # Try the similar match
+        embedding = await self._embed(text)
+        if embedding:
+            value = await self._get(namespace, embedding)
+            if value is not None:
+                return value
+
+        # Compute and store in both tiers
+        value = await compute()
+        if should_store and not should_store(value):
+            return value
+        await asyncio.to_thread(
+            self._disk.set,
+            expire=ENTRIES_EXPIRE,
+            key=exact_key,
+            value=value,
+        )
+        if embedding:
+            await self._set(namespace, embedding, value)
+        return value
+
+    async def _embed(self, text: str) -> Embedding | None:
+        """
+        Embed a text, normalized to compute cosine similarity with a dot product.
+
+        Returns None if the embedding failed, cache is best effort.
+        """
+        try:
+            res = await aembedding(
+                input=[text],
+                model=self._model,
+            )
+        except Exception as e:
+            logger.warning("Semantic cache embedding failed: %s", e)
+            return None
+
+        embedding: Embedding = res.data[0]["embedding"]
+        norm = sqrt(sumprod(embedding, embedding))
+        return [value / norm for value in embedding]
+
+    async def _get(self, namespace: str, embedding: Embedding) -> str | None:
+        """
+        Get the closest response in the namespace, if similar enough.
+        """
+        best_score = self._threshold
+        best_value = None
+        for entry_embedding, value in await self._load(namespace):
+            score = sumprod(embedding, entry_embedding)
+            if score >= best_score:
+                best_score = score
+                best_value = value
+
+        if best_value is not None:
+            logger.debug("Semantic cache hit (score %.3f)", best_score)
+        return best_value
+
+    async def _set(self, namespace: str, embedding: Embedding, value: str) -> None:
+        """
+        Store a response in the namespace.
+
+        If the namespace is full, the oldest entry is removed.
+        """
+        entries = await self._load(namespace)
+        entries.append((embedding, value))
+        del entries[:-MAX_ENTRIES_PER_NAMESPACE]
+
+        # Persist, SQLite I/O is blocking
+        await asyncio.to_thread(
+            self._disk.set,
+            expire=ENTRIES_EXPIRE,
+            key=namespace,
+            value=entries,
+        )
+
+    @property
+    def _disk(self) -> DiskCache:
+        if self._disk_cache is None:
+            self._disk_cache = DiskCache(self._directory)
+        return self._disk_cache
+
+    async def _load(self, namespace: str) -> list[tuple[Embedding, str]]:
+        entries = self._entries.get(namespace)
+        if entries is not None:
+            return entries
+
+        # Load from disk, SQLite I/O is blocking
+        loaded: list[tuple[Embedding, str]] = await asyncio.to_thread(
+            self._disk.get, namespace, []
+        )  # pyright: ignore[reportAssignmentType]
+
+        # Remove the oldest namespace if memory is full
+        if len(self._entries) >= MAX_NAMESPACES_IN_MEMORY:
+            del self._entries[next(iter(self._entries))]
+
+        # Keep the first loaded list if loaded concurrently
+        return self._entries.setdefault(namespace, loaded)
+
+
+SEMANTIC_CACHE = SemanticCache(
+    directory=".semantic_cache",
+    enabled=SEMANTIC_CACHE_ENABLED,
+    model=SEMANTIC_CACHE_MODEL,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+)
@@ -1,15 +1,19 @@
-import asyncio
 from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from orjson import dumps
+from pydantic import ValidationError
 from sse_starlette.sse import EventSourceResponse
 
+from app.helpers.llm import CRAWLER
 from app.helpers.logging import VERSION, logger
 from app.models.chat_completion import (
     ChatCompletionRequest,
     ChatCompletionResponse,
 )
-from app.think import think_stream, think_sync
+from app.think import close_scheduler, think_stream, think_sync
 
 # First log
 logger.info(
@@ -17,6 +21,17 @@ logger.info(
     VERSION,
 )
 
+
+@asynccontextmanager
+async def _lifespan(_: FastAPI) -> AsyncGenerator[None]:
+    # Share the browser across requests
+    async with CRAWLER:
+        yield
+
+        # Stop the remaining objectives, before the browser they use is closed
+        await close_scheduler()
+
+
 # FastAPI
 api = FastAPI(
     contact={
@@ -27,6 +42,7 @@ api = FastAPI(
         "name": "Apache-2.0",
         "url": "https://github.com/clemlesne/deepthink-api/blob/master/LICENSE",
     },
+    lifespan=_lifespan,
     title="deepthink-api",
     version=VERSION,
 )
@@ -34,40 +50,61 @@ api = FastAPI(
 
 @api.post(
     "/v1/chat/completions",
+    # Body is parsed manually, document it explicitly
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {
+                    "schema": ChatCompletionRequest.model_json_schema(
+                        ref_template="#/components/schemas/{model}"
+                    ),
+                },
+            },
+            "required": True,
+        },
+    },
     response_model=ChatCompletionResponse,
 )
 async def v1_chat_completions_sync(
-    req: ChatCompletionRequest,
+    request: Request,
 ) -> ChatCompletionResponse | EventSourceResponse:
+    # Validate the JSON in a single pass, instead of decoding it to Python objects first
+    try:
+        req = ChatCompletionRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors()]
+        )
+
     if not req.stream:
         logger.debug("Sync request")
         return await think_sync(req)
 
     logger.debug("Async request")
-    completions_queue: asyncio.Queue[ChatCompletionResponse] = asyncio.Queue()
-    think_task = asyncio.create_task(
-        think_stream(
-            completions_queue=completions_queue,
-            req=req,
-        )
-    )
 
     async def _generator() -> AsyncGenerator[str]:
-        try:
-            while True:
-                # Consume
-                completion = await completions_queue.get()
-                yield completion.model_dump_json()
-                completions_queue.task_done()
+        header: bytes | None = None
+        async for completion in think_stream(req):
+            # Serialize fields constant across the stream only once, without the closing brace
+            if header is None:
+                header = dumps(
+                    {
+                        "created": completion.created,
+                        "id": completion.id,
+                        "model": completion.model,
+                        "object": completion.object,
+                    }
+                )[:-1]
 
-                # Stop if finish reason is not empty
-                if any(
-                    choice.finish_reason is not None for choice in completion.choices
-                ):
-                    break
-        finally:
-            # Cancel task
-            think_task.cancel()
+            # Serialize only the delta
+            yield (
+                header
+                + b',"choices":'
+                + dumps([choice.model_dump() for choice in completion.choices])
+                + b',"usage":'
+                + dumps(completion.usage and completion.usage.model_dump())
+                + b"}"
+            ).decode()
 
     return EventSourceResponse(
         content=_generator(),
@@ -1,16 +1,29 @@
+from secrets import token_hex
 from time import time
 from typing import Literal
-from uuid import uuid4
 
-from pydantic import BaseModel, Field, computed_field
+from pydantic import BaseModel, ConfigDict, Field, computed_field
+
+
+def completion_id() -> str:
+    """
+    Generate a unique completion ID.
+
+    96 random bits are enough to avoid collisions, without formatting a UUID.
+    """
+    return f"deepthink-{token_hex(12)}"
 
 
 class ChatMessage(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     content: str | None
     role: Literal["system", "user", "assistant"]
 
 
 class ChatCompletionRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     messages: list[ChatMessage]
     model: str
     stream: bool = False
@@ -19,20 +32,31 @@ class ChatCompletionRequest(BaseModel):
 
 
 class ChatChoiceMessage(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     finish_reason: Literal["stop"]
     index: int
     message: ChatMessage
 
 
 class ChatChoiceChunk(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     delta: ChatMessage
     finish_reason: Literal["stop", None] = None
     index: int
 
 
+class PromptTokensDetails(BaseModel):
+    cached_tokens: int = 0
+
+
 class Usage(BaseModel):
     completion_tokens: int = 0
     prompt_tokens: int = 0
+    prompt_tokens_details: PromptTokensDetails = Field(
+        default_factory=PromptTokensDetails
+    )
 
     @computed_field
     @property
@@ -43,7 +67,7 @@ class Usage(BaseModel):
 class ChatCompletionResponse(BaseModel):
     choices: list[ChatChoiceMessage | ChatChoiceChunk]
     created: int = Field(default_factory=lambda: int(time()))
-    id: str = Field(default_factory=lambda: f"deepthink-{uuid4().hex}")
+    id: str = Field(default_factory=completion_id)
     model: str
     object: Literal["chat.completion", "chat.completion.chunk"]
     usage: Usage | None
@@ -1,9 +1,12 @@
+import asyncio
 from enum import StrEnum
+from functools import cached_property
+from typing import Self
 
 from litellm.types.completion import ChatCompletionAssistantMessageParam
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
 
-from app.helpers.llm import MessagesList
+from app.helpers.llm import CompletionKwargs, MessagesList
 from app.models.chat_completion import ChatCompletionRequest, Usage
 
 
@@ -37,6 +40,21 @@ class ObjectiveState(BaseModel):
     short_name: str
     status: ObjectiveStatus = ObjectiveStatus.PENDING
     steps: list[StepState] = []
+    _history: MessagesList = PrivateAttr(default_factory=list)
+    _knowledge: str = PrivateAttr(default="")
+    _knowledge_count: int = PrivateAttr(default=0)
+
+    def add_step(self, step: StepState) -> None:
+        """
+        Add a step to the objective, and its thinking to the history.
+        """
+        self.steps.append(step)
+        self._history.append(
+            ChatCompletionAssistantMessageParam(
+                content=step.thinking,
+                role="assistant",
+            )
+        )
 
     @property
     def summary(self) -> str:
@@ -57,35 +75,78 @@ class ObjectiveState(BaseModel):
     def knowledge(self) -> str:
         """
         Extract the knowledge from the objective.
+
+        Knowledges are only appended, so the text is rebuilt only when some were added since the last read.
         """
-        return "\n".join(
-            [
-                f"### {knowledge.short_name}\n{knowledge.description}\nSource: {knowledge.source}"
-                for knowledge in self.knowledges
-            ]
-        )
+        if self._knowledge_count != len(self.knowledges):
+            self._knowledge = "\n".join(
+                [
+                    f"### {knowledge.short_name}\n{knowledge.description}\nSource: {knowledge.source}"
+                    for knowledge in self.knowledges
+                ]
+            )
+            self._knowledge_count = len(self.knowledges)
+        return self._knowledge
 
     @property
     def history(self) -> MessagesList:
-        return [
-            ChatCompletionAssistantMessageParam(
-                content=step.thinking,
-                role="assistant",
-            )
-            for step in self.steps
-        ]
+        """
+        Thinking of the steps, as a conversation.
+
+        List is maintained with the steps, it is not copied and must not be modified.
+        """
+        return self._history
 
 
 class ThinkState(BaseModel):
     objectives: list[ObjectiveState] = []
     req: ChatCompletionRequest
     usage: Usage = Usage()
+    user_question: str = ""
+    _stop_checks: dict[int, asyncio.Future[bool | str]] = PrivateAttr(
+        default_factory=dict
+    )
+    _stop_checks_joined: asyncio.Event = PrivateAttr(default_factory=asyncio.Event)
+
+    @cached_property
+    def completion_kwargs(self) -> CompletionKwargs:
+        """
+        Sampling parameters from the request, to pass to completions.
+
+        Request is immutable, so the parameters are extracted once.
+        """
+        return CompletionKwargs(
+            model=self.req.model,
+            temperature=self.req.temperature,
+            top_p=self.req.top_p,
+        )
+
+    @property
+    def stop_checks(self) -> dict[int, asyncio.Future[bool | str]]:
+        """
+        Stop checks waiting to be batched, by objective index.
+        """
+        return self._stop_checks
 
     @property
-    def user_question(self) -> str:
+    def stop_checks_joined(self) -> asyncio.Event:
+        """
+        Set when an objective joins the stop checks batch.
+        """
+        return self._stop_checks_joined
+
+    @model_validator(mode="after")
+    def _extract_user_question(self) -> Self:
         """
         Extract the user messages from the request.
+
+        Request is immutable, so the question is extracted once.
         """
-        return " ".join(
-            [message.content for message in self.req.messages if message.role == "user"]
+        self.user_question = " ".join(
+            [
+                message.content
+                for message in self.req.messages
+                if message.role == "user" and message.content
+            ]
         )
+        return self
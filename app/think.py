@@ -1,13 +1,25 @@
 import asyncio
+from collections.abc import AsyncGenerator
+from contextlib import suppress
+from functools import partial
+from os import getenv
+from time import time
 from typing import Annotated
 
-from aiojobs import Scheduler
+from aiojobs import Job, Scheduler
 from litellm.types.completion import ChatCompletionUserMessageParam
 from pydantic import BaseModel, Field
 from structlog.contextvars import bound_contextvars
 
-from app.helpers.llm import non_empty_completion, read_url_tool, validated_completion
+from app.helpers.cache import lru_cache
+from app.helpers.llm import (
+    early_stop_completion,
+    non_empty_completion,
+    read_url_tool,
+    validated_completion,
+)
 from app.helpers.logging import logger
+from app.helpers.semantic_cache import SEMANTIC_CACHE
 from app.models.chat_completion import (
     ChatChoiceChunk,
     ChatChoiceMessage,
@@ -15,6 +27,7 @@ from app.models.chat_completion import (
     ChatCompletionResponse,
     ChatMessage,
     Usage,
+    completion_id,
 )
 from app.models.state import (
     KnowledgeState,
@@ -27,60 +40,207 @@ from app.models.state import (
 MAX_OBJECTIVES = 3
 MIN_STEPS = 3
 MAX_STEPS = 5
+# Objectives run at the same time across all requests, others wait for a slot
+MAX_SIMULTANEOUS_OBJECTIVES = 100
+# Time to wait for the running objectives to join a stop check, in seconds, opt-in as it delays the check
+STOP_CHECK_BATCH_WINDOW = float(getenv("STOP_CHECK_BATCH_WINDOW", "0"))
+
+# System prompts, static so their prefix is cached by the provider, request specific parts are sent as context
+ANSWER_USER_SYSTEM = """
+    Assistant is a business analyst with 20 years of experience.
+
+    # Objective
+    Answer the following question. Answer must be sourced and quantified with a high level of detail.
+
+    # Context
+    You gathered knowledge from research and analysis. This knowledge is trusted and reliable.
+
+    # Rules
+    - Don't make assumptions
+    - Only use the knowledge you gathered to answer
+"""
+DETECT_NEW_OBJECTIVES_SYSTEM = f"""
+    Assistant is a business analyst with 20 years of experience.
+
+    # Objective
+    Determine if the following question can be answered with a high level of confidence. If not, what would be the ideal tasks to answer it? You must be able to add enough sources and quantification to answer the question.
+
+    # Context
+    You already worked on objectives to solve the problem. Effort is limited to {MAX_OBJECTIVES} objectives. Do your best to fulfill the objective within this limit.
+
+    # Rules
+    - Don't make assumptions
+    - Only use the knowledge you gathered to answer
+
+    # Response options
+    - A list of tasks, to help you answer the question
+    - Empty array, if you are confident you can answer the question with the knowledge you gathered
+"""
+NEW_STEP_SYSTEM = f"""
+    Assistant is a business analyst with 20 years of experience. Assistant is meticulous and perfectionist.
+
+    # Objective
+    Solve a problem with a high level of confidence. Think step by step and store relevent knowledge. Knowledge will be used in the end to answer the question. Always find a way to enhance your knowledge and ensure you get the maximim out of the research.
+
+    # Context
+    Effort is limited to {MAX_STEPS} steps. Do your best to fulfill the objective within this limit.
+
+    # Rules
+    - Be concise, no yapping
+    - Don't make assumptions
+    - Only use the knowledge you gathered to answer
+"""
+SHOULD_STOP_OBJECTIVE_SYSTEM = """
+    Assistant is a business analyst with 20 years of experience.
+
+    # Objective
+    Can you answer the following question with a high level of confidence? If yes, provide a detailed answer with sources and quantification.
+
+    # Context
+    You gathered knowledge from research and analysis. This knowledge is trusted and reliable.
+
+    # Rules
+    - Don't make assumptions
+    - Only use the knowledge you gathered to answer
+
+    # Response options
+    - "Can't answer", if you can't answer the question
+    - The full answer, if you can answer the question
+"""
+SHOULD_STOP_OBJECTIVES_SYSTEM = """
+    Assistant is a business analyst with 20 years of experience.
+
+    # Objective
+    For each of the following questions, can you answer it with a high level of confidence? If yes, provide a detailed answer with sources and quantification.
+
+    # Context
+    You gathered knowledge from research and analysis, for each question. This knowledge is trusted and reliable.
+
+    # Rules
+    - Answer each question only with its own knowledge
+    - Don't make assumptions
+    - Only use the knowledge you gathered to answer
+
+    # Response options, for each question
+    - Null, if you can't answer the question
+    - The full answer, if you can answer the question
+"""
+
+
+class _Objective(BaseModel):
+    completion_criteria: str = Field(
+        description="How can we measure the completion of this research?",
+    )
+    description: str = Field(
+        description="What is the objective of this research?",
+    )
+    short_name: str = Field(
+        description="A short sentence to identify easily the objective.",
+    )
+
+
+class _Res(BaseModel):
+    tasks: list[_Objective] = Field(
+        max_length=3,  # Not too much new objectives to make sure the thinking is focused
+    )
+
+
+class _Decision(BaseModel):
+    answer: str | None = Field(
+        description="The full answer, if you can answer the question. Null if you can't answer.",
+    )
+    objective_id: int = Field(
+        description="Identifier of the objective.",
+    )
+
+
+class _Decisions(BaseModel):
+    decisions: list[_Decision]
+
+
+class KnowledgeTool:
+    """
+    Tool persisting knowledge into an objective.
+
+    Tool is a class, so its schema is introspected once and only the objective is bound per step.
+    """
+
+    def __init__(self, objective: ObjectiveState) -> None:
+        self._objective = objective
+
+    async def __call__(
+        self,
+        knowledge: Annotated[str, "Knowledge to persist, like facts or data."],
+        short_name: Annotated[str, "A short sentence to identify easily the step."],
+        source: Annotated[str, "Source of the knowledge, like a URL or an author."],
+    ) -> str:
+        """
+        Persist knowledge into the documentation database.
+
+        A knowledge:
+        - Must be facts or data that will be used to answer the question
+        - Must be sourced from a reliable source
+        """
+        self._objective.knowledges.append(
+            KnowledgeState(
+                description=knowledge,
+                short_name=short_name,
+                source=source,
+            )
+        )
+        # logger.debug("Knowledge persisted: %s", knowledge)
+        return "Knowledge persisted."
+
+
+class _ObjectivesTree:
+    """
+    Objectives and their steps, as a tree.
+
+    Tree is built when formatted, so only if the log record is emitted.
+    """
+
+    def __init__(self, state: ThinkState) -> None:
+        self._state = state
+
+    def __str__(self) -> str:
+        tree = [f"Initial question: {self._state.user_question}"]
+        for objective in self._state.objectives:
+            tree.append(f" | Objective: {objective.short_name} ({objective.status})")
+            tree.extend(f" |-- Step: {step.short_name}" for step in objective.steps)
+        return "\n".join(tree)
+
+
+@lru_cache(maxsize=1)
+def get_scheduler() -> Scheduler:
+    """
+    Get the objectives scheduler, shared across requests.
+
+    Scheduler is bound to the running event loop, so it is created on first use.
+    """
+    return Scheduler(limit=MAX_SIMULTANEOUS_OBJECTIVES)
+
+
+async def close_scheduler() -> None:
+    """
+    Stop the remaining objectives, and close the scheduler.
+
+    A closed scheduler can't spawn jobs, so a new one is created on next use, on the loop running then.
+    """
+    await get_scheduler().close()
+    get_scheduler.cache_clear()
 
 
 async def think_stream(
     req: ChatCompletionRequest,
-    completions_queue: asyncio.Queue[ChatCompletionResponse],
-) -> None:
+) -> AsyncGenerator[ChatCompletionResponse]:
     content_queue: asyncio.Queue[str] = asyncio.Queue()
     thinking_queue: asyncio.Queue[str] = asyncio.Queue()
 
-    async def _consume_content() -> None:
-        while True:
-            content = await content_queue.get()
-            await completions_queue.put(
-                ChatCompletionResponse(
-                    model=req.model,
-                    object="chat.completion.chunk",
-                    usage=None,
-                    choices=[
-                        ChatChoiceChunk(
-                            delta=ChatMessage(
-                                content=content,
-                                role="assistant",
-                            ),
-                            index=0,
-                            finish_reason=None,
-                        ),
-                    ],
-                )
-            )
-            content_queue.task_done()
-
-    async def _consume_thinking() -> None:
-        while True:
-            thinking = await thinking_queue.get()
-            await completions_queue.put(
-                ChatCompletionResponse(
-                    model=req.model,
-                    object="chat.completion.chunk",
-                    usage=None,
-                    choices=[
-                        ChatChoiceChunk(
-                            delta=ChatMessage(
-                                content=f"<think>{thinking}</think>",
-                                role="assistant",
-                            ),
-                            index=0,
-                            finish_reason=None,
-                        ),
-                    ],
-                )
-            )
-            thinking_queue.task_done()
+    # All chunks of a stream share the same ID and creation time
+    created = int(time())
+    stream_id = completion_id()
 
-    # Start thinking task
+    # Start thinking task, end the thinking stream when it is done
     think_task = asyncio.create_task(
         _think(
             content_queue=content_queue,
@@ -88,25 +248,60 @@ async def think_stream(
             thinking_queue=thinking_queue,
         )
     )
+    think_task.add_done_callback(lambda _: thinking_queue.shutdown())
 
-    # Start consumers
-    content_task = asyncio.create_task(_consume_content())
-    thinking_task = asyncio.create_task(_consume_thinking())
-
-    # Wait for thinking task to finish
-    usage = await think_task
+    try:
+        # Stream thinking as it comes, until the queue is shut down and empty
+        while True:
+            try:
+                thinking = await thinking_queue.get()
+            except asyncio.QueueShutDown:
+                break
+            yield ChatCompletionResponse(
+                created=created,
+                id=stream_id,
+                model=req.model,
+                object="chat.completion.chunk",
+                usage=None,
+                choices=[
+                    ChatChoiceChunk(
+                        delta=ChatMessage(
+                            content=f"<think>{thinking}</think>",
+                            role="assistant",
+                        ),
+                        index=0,
+                        finish_reason=None,
+                    ),
+                ],
+            )
 
-    # Wait for queue to empty and kill consumers
-    await asyncio.gather(
-        content_queue.join(),
-        thinking_queue.join(),
-    )
-    content_task.cancel()
-    thinking_task.cancel()
+        # Raise if thinking failed
+        usage = await think_task
+
+        # Stream content, which is only available at the end of thinking
+        while not content_queue.empty():
+            yield ChatCompletionResponse(
+                created=created,
+                id=stream_id,
+                model=req.model,
+                object="chat.completion.chunk",
+                usage=None,
+                choices=[
+                    ChatChoiceChunk(
+                        delta=ChatMessage(
+                            content=content_queue.get_nowait(),
+                            role="assistant",
+                        ),
+                        index=0,
+                        finish_reason=None,
+                    ),
+                ],
+            )
 
-    # Send end of stream
-    await completions_queue.put(
-        ChatCompletionResponse(
+        # Send end of stream
+        yield ChatCompletionResponse(
+            created=created,
+            id=stream_id,
             model=req.model,
             object="chat.completion.chunk",
             usage=usage,  # As per OpenAI spec, usage is sent in the last chunk
@@ -121,7 +316,9 @@ async def think_stream(
                 ),
             ],
         )
-    )
+    finally:
+        # Stop thinking if the client disconnected
+        think_task.cancel()
 
 
 async def think_sync(req: ChatCompletionRequest) -> ChatCompletionResponse:
@@ -193,27 +390,41 @@ async def _think(
         )
     )
 
-    async with Scheduler() as scheduler:
-        # Schedule the first objective
-        await scheduler.spawn(
+    scheduler = get_scheduler()
+    jobs: list[Job[None]] = []
+    running: set[asyncio.Future[None]] = set()
+
+    async def _spawn(objective: ObjectiveState) -> asyncio.Future[None]:
+        job = await scheduler.spawn(
             _run_objective(
-                objective=state.objectives[0],
+                objective=objective,
                 think=state,
                 thinking_queue=thinking_queue,
             )
         )
+        jobs.append(job)
+        return asyncio.ensure_future(job.wait())
+
+    try:
+        # Schedule the first objective
+        running.add(await _spawn(state.objectives[0]))
 
         # Run the scheduler until all objectives are completed or failed
-        while any(
-            objective.status in (ObjectiveStatus.IN_PROGRESS, ObjectiveStatus.PENDING)
-            for objective in state.objectives
-        ):
-            # Wait for all tasks to complete
-            while scheduler.active_count > 0:
-                await asyncio.sleep(0.1)
+        while running:
+            # Wait for any objective to end, others keep running
+            done, running = await asyncio.wait(
+                running,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for future in done:
+                future.result()  # Raise if the objective crashed
+
+            # Skip detection if max objectives reached
+            if len(state.objectives) >= MAX_OBJECTIVES:
+                logger.debug("Max objectives reached")
                 continue
 
-            # Update state
+            # Update state, objectives are only added by this loop so no lock is needed
             new_objectives: list[ObjectiveState] = []
             for objective in await _detect_new_objectives(state):
                 # Stop if max objectives reached
@@ -223,13 +434,9 @@ async def _think(
                 new_objectives.append(objective)
                 state.objectives.append(objective)
 
-            # Abort iteration if no new objectives
+            # Wait for running objectives if no new objectives
             if not new_objectives:
-                # If maximum objectives reached, stop the loop
-                if scheduler.active_count == 0:
-                    logger.debug("Max objectives reached")
-                    break
-                # Wait for objectives to complete
+                logger.debug("No new objectives")
                 continue
 
             logger.debug(
@@ -237,29 +444,18 @@ async def _think(
                 [objective.short_name for objective in new_objectives],
             )
 
-            # Schedule new objectives
+            # Schedule new objectives, alongside the running ones
             for objective in new_objectives:
-                await scheduler.spawn(
-                    _run_objective(
-                        objective=objective,
-                        think=state,
-                        thinking_queue=thinking_queue,
-                    )
-                )
+                running.add(await _spawn(objective))
 
-    # Pretty pring objectives and steps with a tree, for debugging
-    logger.debug("Initial question: %s", state.user_question)
-    for objective in state.objectives:
-        logger.debug(
-            " | Objective: %s (%s)",
-            objective.short_name,
-            objective.status,
-        )
-        for step in objective.steps:
-            logger.debug(
-                " |-- Step: %s",
-                step.short_name,
-            )
+    # Stop the objectives of this request only, the scheduler is shared
+    finally:
+        for future in running:
+            future.cancel()
+        await asyncio.gather(*[job.close() for job in jobs])
+
+    # Pretty pring objectives and steps with a tree, for debugging, in a single record
+    logger.debug("%s", _ObjectivesTree(state))
 
     # Get answer
     answer = await _answer_user(state)
@@ -293,23 +489,10 @@ async def _answer_user(
     # logger.debug("Using answers: %s", answers)
 
     res = await non_empty_completion(
-        model=think.req.model,
-        temperature=think.req.temperature,
-        top_p=think.req.top_p,
+        **think.completion_kwargs,
         usage=think.usage,
-        system=f"""
-            Assistant is a business analyst with 20 years of experience.
-
-            # Objective
-            Answer the following question. Answer must be sourced and quantified with a high level of detail.
-
-            # Context
-            You gathered knowledge from research and analysis. This knowledge is trusted and reliable.
-
-            # Rules
-            - Don't make assumptions
-            - Only use the knowledge you gathered to answer
-
+        system=ANSWER_USER_SYSTEM,
+        system_context=f"""
             # Question
             {think.user_question}
 
@@ -331,58 +514,31 @@ async def _detect_new_objectives(
 
     Response is a list of tasks that the assistant will do to answer the question. If the assistant can answer the question, list will be empty.
     """
+    content = f"""
+        {"\n".join([f"{objective.description}: {objective.answer}" for objective in think.objectives if objective.answer])}
+        {"\n".join([f"{objective.description}: {objective.status}" for objective in think.objectives if not objective.answer])}
+    """
+    system_context = f"""
+        # Progress
+        You've already started {len(think.objectives)} objectives.
 
-    class _Objective(BaseModel):
-        completion_criteria: str = Field(
-            description="How can we measure the completion of this research?",
-        )
-        description: str = Field(
-            description="What is the objective of this research?",
-        )
-        short_name: str = Field(
-            description="A short sentence to identify easily the objective.",
-        )
-
-    class _Res(BaseModel):
-        tasks: list[_Objective] = Field(
-            max_length=3,  # Not too much new objectives to make sure the thinking is focused
-        )
+        # Question
+        {think.user_question}
+    """
 
+    # Not cached, progress after an objective ended is similar to the previous one and would return the same objectives
     res = await validated_completion(
+        **think.completion_kwargs,
         res_type=_Res,
-        model=think.req.model,
-        temperature=think.req.temperature,
-        top_p=think.req.top_p,
         usage=think.usage,
         existing_history=[
             ChatCompletionUserMessageParam(
-                content=f"""
-                    {"\n".join([f"{objective.description}: {objective.answer}" for objective in think.objectives if objective.answer])}
-                    {"\n".join([f"{objective.description}: {objective.status}" for objective in think.objectives if not objective.answer])}
-                """,
+                content=content,
                 role="user",
             ),
         ],
-        system=f"""
-            Assistant is a business analyst with 20 years of experience.
-
-            # Objective
-            Determine if the following question can be answered with a high level of confidence. If not, what would be the ideal tasks to answer it? You must be able to add enough sources and quantification to answer the question.
-
-            # Context
-            You already worked on objectives to solve the problem. Effort is limited to {MAX_OBJECTIVES} objectives, you've already started {len(think.objectives)} one. Do your best to fulfill the objective within this limit.
-
-            # Rules
-            - Don't make assumptions
-            - Only use the knowledge you gathered to answer
-
-            # Question
-            {think.user_question}
-
-            # Response options
-            - A list of tasks, to help you answer the question
-            - Empty array, if you are confident you can answer the question with the knowledge you gathered
-        """,
+        system=DETECT_NEW_OBJECTIVES_SYSTEM,
+        system_context=system_context,
     )
 
     return [
@@ -416,38 +572,44 @@ async def _run_objective(
         )
         objective.status = ObjectiveStatus.IN_PROGRESS
 
-        while objective.status is ObjectiveStatus.IN_PROGRESS:
-            # Ensure a minimum steps to force cognition
-            if len(objective.steps) >= MIN_STEPS:
-                # Check if completed
-                should_stop = await _should_stop_objective(
-                    think=think,
-                    objective=objective,
-                )
-                if isinstance(should_stop, str):
-                    logger.debug("Objective completed: %s", should_stop)
-                    objective.status = ObjectiveStatus.COMPLETED
-                    objective.answer = should_stop
+        try:
+            while objective.status is ObjectiveStatus.IN_PROGRESS:
+                # Ensure a minimum steps to force cognition, and skip the check without knowledge to answer from
+                if len(objective.steps) >= MIN_STEPS and objective.knowledges:
+                    # Check if completed
+                    should_stop = await _should_stop_objective(
+                        think=think,
+                        objective=objective,
+                    )
+                    if isinstance(should_stop, str):
+                        logger.debug("Objective completed: %s", should_stop)
+                        objective.status = ObjectiveStatus.COMPLETED
+                        objective.answer = should_stop
+                        break
+
+                # Check if max steps reached
+                if len(objective.steps) >= MAX_STEPS:
+                    objective.status = ObjectiveStatus.FAILED
                     break
 
-            # Check if max steps reached
-            if len(objective.steps) >= MAX_STEPS:
-                objective.status = ObjectiveStatus.FAILED
-                break
+                # Create new step
+                step = await _new_step(
+                    objective=objective,
+                    think=think,
+                )
+                objective.add_step(step)
+                await thinking_queue.put(step.short_name)
+                logger.debug(
+                    "New step: %s (%i/%i)",
+                    step.short_name,
+                    len(objective.steps),
+                    MAX_STEPS,
+                )
 
-            # Create new step
-            step = await _new_step(
-                objective=objective,
-                think=think,
-            )
-            objective.steps.append(step)
-            await thinking_queue.put(step.short_name)
-            logger.debug(
-                "New step: %s (%i/%i)",
-                step.short_name,
-                len(objective.steps),
-                MAX_STEPS,
-            )
+        # Fail the objective only, others can still answer the question
+        except Exception:
+            logger.exception("Objective failed")
+            objective.status = ObjectiveStatus.FAILED
 
         logger.debug("Objective ended: %s", objective.status)
 
@@ -460,45 +622,162 @@ async def _should_stop_objective(
     Check if the assistant can answer the objective.
 
     If the assistant can answer the objective, return the answer. Else, return False.
+
+    Objectives checked at the same time are batched in a single completion. The first one of a batch lets the others join, then runs it for all.
     """
-    res = await non_empty_completion(
-        model=think.req.model,
-        temperature=think.req.temperature,
-        top_p=think.req.top_p,
+    checks = think.stop_checks
+    future: asyncio.Future[bool | str] = asyncio.get_running_loop().create_future()
+    # Identify by position, as objectives with the same fields are equal
+    checks[
+        next(
+            index
+            for index, candidate in enumerate(think.objectives)
+            if candidate is objective
+        )
+    ] = future
+
+    # Follow the batch if already started, and wake the leader waiting for it
+    if len(checks) > 1:
+        think.stop_checks_joined.set()
+        return await future
+
+    # Lead the batch, wait for others to join
+    try:
+        await _wait_stop_checks(think)
+    except asyncio.CancelledError:
+        for pending in checks.values():
+            pending.cancel()
+        checks.clear()
+        raise
+    batch = dict(checks)
+    checks.clear()
+
+    # Resolve the batch, failures are raised to all its objectives
+    try:
+        if len(batch) == 1:
+            future.set_result(await _should_stop_single(think, objective))
+        else:
+            for index, decision in (
+                await _should_stop_batch(think, list(batch))
+            ).items():
+                if not batch[index].done():  # Skip objectives cancelled meanwhile
+                    batch[index].set_result(decision)
+    except asyncio.CancelledError:
+        for pending in batch.values():
+            pending.cancel()
+        raise
+    except Exception as e:
+        for pending in batch.values():
+            if not pending.done():
+                pending.set_exception(e)
+
+    return await future
+
+
+async def _wait_stop_checks(
+    think: ThinkState,
+) -> None:
+    """
+    Wait for the running objectives to join the stop checks batch.
+
+    Checks started in the same loop iteration always join. If a batch window is configured, wait up to it, until all running objectives joined.
+    """
+    await asyncio.sleep(0)
+    if not STOP_CHECK_BATCH_WINDOW:
+        return
+
+    joined = think.stop_checks_joined
+    with suppress(TimeoutError):
+        async with asyncio.timeout(STOP_CHECK_BATCH_WINDOW):
+            while len(think.stop_checks) < sum(
+                1
+                for objective in think.objectives
+                if objective.status is ObjectiveStatus.IN_PROGRESS
+            ):
+                joined.clear()
+                await joined.wait()
+
+
+async def _should_stop_batch(
+    think: ThinkState,
+    indexes: list[int],
+) -> dict[int, bool | str]:
+    """
+    Check if the assistant can answer multiple objectives, in a single completion.
+
+    Returns the answer of each objective, or False if it can't be answered.
+    """
+    objectives = "\n\n".join(
+        [
+            f"# Objective {index}\n\n## Question\n{think.objectives[index].description}\n\n## Completion criteria\n{think.objectives[index].completion_criteria}\n\n## Knowledge\n{think.objectives[index].knowledge}"
+            for index in indexes
+        ]
+    )
+
+    res = await validated_completion(
+        **think.completion_kwargs,
+        res_type=_Decisions,
         usage=think.usage,
         existing_history=[
             ChatCompletionUserMessageParam(
-                content=objective.knowledge,
+                content=objectives,
                 role="user",
             ),
         ],
-        system=f"""
-            Assistant is a business analyst with 20 years of experience.
+        system=SHOULD_STOP_OBJECTIVES_SYSTEM,
+    )
 
-            # Objective
-            Can you answer the following question with a high level of confidence? If yes, provide a detailed answer with sources and quantification.
+    # Objectives not decided can't be answered
+    decisions: dict[int, bool | str] = dict.fromkeys(indexes, False)
+    for decision in res.decisions:
+        if decision.objective_id in decisions and decision.answer:
+            decisions[decision.objective_id] = decision.answer
+    return decisions
 
-            # Context
-            You gathered knowledge from research and analysis. This knowledge is trusted and reliable.
 
-            # Rules
-            - Don't make assumptions
-            - Only use the knowledge you gathered to answer
+async def _should_stop_single(
+    think: ThinkState,
+    objective: ObjectiveState,
+) -> bool | str:
+    """
+    Check if the assistant can answer a single objective.
 
-            # Question
-            {objective.description}
+    If the assistant can answer the objective, return the answer. Else, return False.
+    """
+    system_context = f"""
+        # Question
+        {objective.description}
 
-            # Completion criteria
-            {objective.completion_criteria}
+        # Completion criteria
+        {objective.completion_criteria}
+    """
 
-            # Response options
-            - "Can't answer", if you can't answer the question
-            - The full answer, if you can answer the question
-        """,
+    # Similar knowledge on a similar objective leads to the same answer, only answers are cached as knowledge grows until one is found
+    res = await SEMANTIC_CACHE.get_or_compute(
+        compute=partial(
+            early_stop_completion,
+            **think.completion_kwargs,
+            stop_prefix="Can't answer",  # Don't generate the rest if it can't answer
+            usage=think.usage,
+            existing_history=[
+                ChatCompletionUserMessageParam(
+                    content=objective.knowledge,
+                    role="user",
+                ),
+            ],
+            system=SHOULD_STOP_OBJECTIVE_SYSTEM,
+            system_context=system_context,
+        ),
+        namespace=_cache_namespace(
+            system=SHOULD_STOP_OBJECTIVE_SYSTEM,
+            think=think,
+        ),
+        text=f"{system_context}\n{objective.knowledge}",
+        should_store=_is_answer,
     )
 
     # Return false if can't answer
-    if "can't answer" in res.lower():
+    if not _is_answer(res):
         return False
 
     # Return the answer
@@ -515,57 +794,22 @@ async def _new_step(
     Step is a question that will be asked to the assistant.
     """
 
-    async def _knowledge_tool(
-        knowledge: Annotated[str, "Knowledge to persist, like facts or data."],
-        short_name: Annotated[str, "A short sentence to identify easily the step."],
-        source: Annotated[str, "Source of the knowledge, like a URL or an author."],
-    ) -> str:
-        """
-        Persist knowledge into the documentation database.
-
-        A knowledge:
-        - Must be facts or data that will be used to answer the question
-        - Must be sourced from a reliable source
-        """
-        objective.knowledges.append(
-            KnowledgeState(
-                description=knowledge,
-                short_name=short_name,
-                source=source,
-            )
-        )
-        # logger.debug("Knowledge persisted: %s", knowledge)
-        return "Knowledge persisted."
-
     return await validated_completion(
+        **think.completion_kwargs,
         existing_history=objective.history,
-        model=think.req.model,
         res_type=StepState,
-        temperature=think.req.temperature,
         tools=[
-            _knowledge_tool,
+            KnowledgeTool(objective),
             read_url_tool(
-                model=think.req.model,
-                temperature=think.req.temperature,
-                top_p=think.req.top_p,
+                **think.completion_kwargs,
                 usage=think.usage,
             ),
         ],
-        top_p=think.req.top_p,
         usage=think.usage,
-        system=f"""
-            Assistant is a business analyst with 20 years of experience. Assistant is meticulous and perfectionist.
-
-            # Objective
-            Solve a problem with a high level of confidence. Think step by step and store relevent knowledge. Knowledge will be used in the end to answer the question. Always find a way to enhance your knowledge and ensure you get the maximim out of the research.
-
-            # Context
-            Effort is limited to {MAX_STEPS} steps, you've already completed {len(objective.steps)} one. Do your best to fulfill the objective within this limit.
-
-            # Rules
-            - Be concise, no yapping
-            - Don't make assumptions
-            - Only use the knowledge you gathered to answer
+        system=NEW_STEP_SYSTEM,
+        system_context=f"""
+            # Progress
+            You've already completed {len(objective.steps)} steps.
 
             # Question
             {objective.description}
@@ -574,3 +818,22 @@ async def _new_step(
             {objective.knowledge}
         """,
     )
+
+
+def _is_answer(res: str) -> bool:
+    """
+    Check if a stop check response answers the objective.
+    """
+    return "can't answer" not in res.lower()
+
+
+def _cache_namespace(
+    system: str,
+    think: ThinkState,
+) -> str:
+    """
+    Build the semantic cache namespace of a completion.
+
+    Everything not in the matched text must be equal to reuse a response.
+    """
+    return f"{think.req.model}\n{think.req.temperature}\n{think.req.top_p}\n{system}"
@@ -0,0 +1,95 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.helpers.cache import lru_acache
+
+
+@pytest.mark.asyncio
+async def test_lru_acache_coalesce():
+    calls: list[int] = []
+
+    @lru_acache()
+    async def _compute(value: int) -> int:
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    res = await asyncio.gather(_compute(1), _compute(1), _compute(2))
+
+    # Validate concurrent calls share the same execution
+    assert res == [2, 2, 4]
+    assert sorted(calls) == [1, 2]
+
+    # Validate the value is cached
+    assert await _compute(1) == 2  # noqa: PLR2004
+    assert sorted(calls) == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_lru_acache_retry_failure():
+    calls: list[int] = []
+
+    @lru_acache()
+    async def _compute(value: int) -> int:
+        calls.append(value)
+        if len(calls) == 1:
+            raise RuntimeError("First call fails")
+        return value
+
+    # Validate the failure is raised, and not cached
+    with pytest.raises(RuntimeError):
+        await _compute(1)
+    assert await _compute(1) == 1
+    assert calls == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_lru_acache_cancel_caller():
+    calls: list[int] = []
+
+    @lru_acache()
+    async def _compute(value: int) -> int:
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    cancelled = asyncio.create_task(_compute(1))
+    kept = asyncio.create_task(_compute(1))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+
+    # Validate the shared execution survives the cancellation of a caller
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    assert await kept == 1
+    assert calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_lru_acache_persist(tmp_path: Path):
+    calls: list[int] = []
+
+    def _decorate():
+        # Same function in a new process, with an empty memory cache
+        @lru_acache(persist_path=str(tmp_path))
+        async def _compute(value: int) -> int | None:
+            calls.append(value)
+            return value or None
+
+        return _compute
+
+    first = _decorate()
+    assert await first(1) == 1
+    assert await first(0) is None
+
+    # Validate values are read from disk, including a None value
+    second = _decorate()
+    assert await second(1) == 1
+    assert await second(0) is None
+    assert calls == [1, 0]
+
+    # Validate other arguments are computed
+    assert await second(2) == 2  # noqa: PLR2004
+    assert calls == [1, 0, 2]
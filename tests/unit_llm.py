@@ -0,0 +1,121 @@
+from collections.abc import AsyncGenerator
+from types import SimpleNamespace
+
+import pytest
+
+from app.helpers import llm
+from app.helpers.llm import CompletionException, early_stop_completion
+from app.models.chat_completion import Usage
+
+
+class _Stream:
+    """
+    Fake Litellm completion stream, recording the consumed chunks.
+    """
+
+    def __init__(self, deltas: list[str | None], finish_reason: str | None) -> None:
+        self.closed = False
+        self.completion_stream = self
+        self.consumed = 0
+        self.kwargs: dict = {}
+        self._deltas = deltas
+        self._finish_reason = finish_reason
+
+    async def __aiter__(self) -> AsyncGenerator[SimpleNamespace]:
+        for index, delta in enumerate(self._deltas):
+            self.consumed += 1
+            yield SimpleNamespace(
+                choices=[
+                    SimpleNamespace(
+                        delta=SimpleNamespace(content=delta),
+                        finish_reason=self._finish_reason
+                        if index == len(self._deltas) - 1
+                        else None,
+                    )
+                ],
+                usage=None,
+            )
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+def _mock_completion(
+    monkeypatch: pytest.MonkeyPatch,
+    deltas: list[str | None],
+    finish_reason: str | None = "stop",
+) -> _Stream:
+    stream = _Stream(deltas, finish_reason)
+
+    async def _acompletion(**kwargs) -> _Stream:
+        stream.kwargs = kwargs
+        return stream
+
+    monkeypatch.setattr(llm, "acompletion", _acompletion)
+    return stream
+
+
+async def _complete(usage: Usage) -> str:
+    return await early_stop_completion(
+        model="gpt-4o-mini",
+        stop_prefix="Can't answer",
+        system="Answer the question.",
+        temperature=1,
+        top_p=1,
+        usage=usage,
+    )
+
+
+@pytest.mark.asyncio
+async def test_early_stop_prefix(monkeypatch: pytest.MonkeyPatch):
+    stream = _mock_completion(
+        monkeypatch,
+        [' "CAN', "'T answer", " because", " of", " reasons"],
+        finish_reason=None,
+    )
+    usage = Usage()
+
+    res = await _complete(usage)
+
+    # Validate the stream is stopped as soon as the prefix is received, ignoring quotes and case
+    assert res == " \"CAN'T answer"
+    assert stream.consumed == 2  # noqa: PLR2004
+    assert stream.closed
+
+    # Validate the usage is estimated
+    assert usage.prompt_tokens > 0
+    assert usage.completion_tokens > 0
+
+
+@pytest.mark.asyncio
+async def test_early_stop_full(monkeypatch: pytest.MonkeyPatch):
+    stream = _mock_completion(monkeypatch, ["The ", "answer", None])
+
+    res = await _complete(Usage())
+
+    # Validate the whole response is returned
+    assert res == "The answer"
+    assert stream.consumed == 3  # noqa: PLR2004
+    assert stream.closed
+
+    # Validate the Litellm cache is used
+    assert stream.kwargs["caching"] is True
+
+
+@pytest.mark.asyncio
+async def test_early_stop_failed(monkeypatch: pytest.MonkeyPatch):
+    stream = _mock_completion(monkeypatch, ["The "], finish_reason="content_filter")
+
+    # Validate a failed response is raised
+    with pytest.raises(CompletionException):
+        await _complete(Usage())
+    assert stream.closed
+
+
+@pytest.mark.asyncio
+async def test_early_stop_empty(monkeypatch: pytest.MonkeyPatch):
+    _mock_completion(monkeypatch, [None])
+
+    # Validate an empty response is raised
+    with pytest.raises(CompletionException):
+        await _complete(Usage())
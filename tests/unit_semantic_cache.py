@@ -0,0 +1,186 @@
+from pathlib import Path
+
+import pytest
+
+from app.helpers.semantic_cache import Embedding, SemanticCache
+
+# Normalized embeddings, the similar one has a cosine similarity of 0.96
+EMBEDDINGS: dict[str, Embedding] = {
+    "Question": [1, 0],
+    "Question, rephrased": [0.96, 0.28],
+    "Other question": [0, 1],
+}
+
+
+class _Cache(SemanticCache):
+    """
+    Semantic cache with fixed embeddings, recording the embedded texts.
+    """
+
+    def __init__(self, directory: Path, enabled: bool = True) -> None:
+        super().__init__(
+            directory=str(directory / "cache"),
+            enabled=enabled,
+            model="mock",
+            threshold=0.85,
+        )
+        self.embedded: list[str] = []
+
+    async def _embed(self, text: str) -> Embedding | None:
+        self.embedded.append(text)
+        return EMBEDDINGS.get(text)
+
+
+class _Compute:
+    """
+    Response computation, recording the number of calls.
+    """
+
+    def __init__(self, value: str = "Answer") -> None:
+        self.calls = 0
+        self.value = value
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        return self.value
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_disabled(tmp_path: Path):
+    cache = _Cache(tmp_path, enabled=False)
+    compute = _Compute()
+
+    for _ in range(2):
+        assert (
+            await cache.get_or_compute(
+                compute=compute,
+                namespace="Namespace",
+                text="Question",
+            )
+            == "Answer"
+        )
+
+    # Validate the response is always computed, without embedding nor opening the disk store
+    assert compute.calls == 2  # noqa: PLR2004
+    assert not cache.embedded
+    assert not (tmp_path / "cache").exists()
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_exact(tmp_path: Path):
+    cache = _Cache(tmp_path)
+    compute = _Compute()
+
+    for _ in range(2):
+        assert (
+            await cache.get_or_compute(
+                compute=compute,
+                namespace="Namespace",
+                text="Question",
+            )
+            == "Answer"
+        )
+
+    # Validate the same text is matched without embedding it again
+    assert compute.calls == 1
+    assert cache.embedded == ["Question"]
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_similar(tmp_path: Path):
+    cache = _Cache(tmp_path)
+    compute = _Compute()
+
+    for text in ("Question", "Question, rephrased"):
+        assert (
+            await cache.get_or_compute(
+                compute=compute,
+                namespace="Namespace",
+                text=text,
+            )
+            == "Answer"
+        )
+    assert compute.calls == 1
+
+    # Validate a dissimilar text is computed
+    other = _Compute("Other answer")
+    assert (
+        await cache.get_or_compute(
+            compute=other,
+            namespace="Namespace",
+            text="Other question",
+        )
+        == "Other answer"
+    )
+    assert other.calls == 1
+
+    # Validate namespaces are not shared
+    assert (
+        await cache.get_or_compute(
+            compute=other,
+            namespace="Other namespace",
+            text="Question, rephrased",
+        )
+        == "Other answer"
+    )
+    assert other.calls == 2  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_persist(tmp_path: Path):
+    compute = _Compute()
+    await _Cache(tmp_path).get_or_compute(
+        compute=compute,
+        namespace="Namespace",
+        text="Question",
+    )
+
+    # Validate a new cache, with an empty memory, reads the similar entries from disk
+    assert (
+        await _Cache(tmp_path).get_or_compute(
+            compute=compute,
+            namespace="Namespace",
+            text="Question, rephrased",
+        )
+        == "Answer"
+    )
+    assert compute.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_should_store(tmp_path: Path):
+    cache = _Cache(tmp_path)
+    compute = _Compute("Can't answer")
+
+    for _ in range(2):
+        assert (
+            await cache.get_or_compute(
+                compute=compute,
+                namespace="Namespace",
+                text="Question",
+                should_store=lambda value: value != "Can't answer",
+            )
+            == "Can't answer"
+        )
+
+    # Validate responses failing the check are not stored
+    assert compute.calls == 2  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_embedding_failed(tmp_path: Path):
+    cache = _Cache(tmp_path)
+    compute = _Compute()
+
+    for _ in range(2):
+        assert (
+            await cache.get_or_compute(
+                compute=compute,
+                namespace="Namespace",
+                text="Unknown question",
+            )
+            == "Answer"
+        )
+
+    # Validate the exact match is still stored
+    assert compute.calls == 1
@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+
+from app import think
+from app.models.chat_completion import ChatCompletionRequest, ChatMessage
+from app.models.state import ObjectiveState, ObjectiveStatus, ThinkState
+
+
+def _state(objectives: int) -> ThinkState:
+    return ThinkState(
+        objectives=[
+            ObjectiveState(
+                completion_criteria=f"Criteria {index}",
+                description=f"Description {index}",
+                short_name=f"Objective {index}",
+                status=ObjectiveStatus.IN_PROGRESS,
+            )
+            for index in range(objectives)
+        ],
+        req=ChatCompletionRequest(
+            messages=[
+                ChatMessage(
+                    content="What is the status of the world?",
+                    role="user",
+                ),
+            ],
+            model="mock",
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_should_stop_single(monkeypatch: pytest.MonkeyPatch):
+    state = _state(1)
+    batches: list[list[int]] = []
+
+    async def _single(*_args) -> bool | str:
+        return "Answer"
+
+    async def _batch(_think: ThinkState, indexes: list[int]) -> dict[int, bool | str]:
+        batches.append(indexes)
+        return {}
+
+    monkeypatch.setattr(think, "_should_stop_single", _single)
+    monkeypatch.setattr(think, "_should_stop_batch", _batch)
+    # Fail if the window is waited for, no other objective can join
+    monkeypatch.setattr(think, "STOP_CHECK_BATCH_WINDOW", 60)
+
+    res = await asyncio.wait_for(
+        think._should_stop_objective(
+            objective=state.objectives[0],
+            think=state,
+        ),
+        timeout=1,
+    )
+
+    # Validate response
+    assert res == "Answer"
+    assert not batches
+    assert not state.stop_checks
+
+
+@pytest.mark.asyncio
+async def test_should_stop_batch(monkeypatch: pytest.MonkeyPatch):
+    state = _state(2)
+    batches: list[list[int]] = []
+
+    async def _single(*_args) -> bool | str:
+        raise AssertionError("Single check used in a batch")
+
+    async def _batch(_think: ThinkState, indexes: list[int]) -> dict[int, bool | str]:
+        batches.append(indexes)
+        return {0: "Answer", 1: False}
+
+    monkeypatch.setattr(think, "_should_stop_single", _single)
+    monkeypatch.setattr(think, "_should_stop_batch", _batch)
+
+    res = await asyncio.gather(
+        *[
+            think._should_stop_objective(
+                objective=objective,
+                think=state,
+            )
+            for objective in state.objectives
+        ]
+    )
+
+    # Validate response
+    assert res == ["Answer", False]
+    assert batches == [[0, 1]]
+    assert not state.stop_checks
+
+
+@pytest.mark.asyncio
+async def test_should_stop_cancelled_leader(monkeypatch: pytest.MonkeyPatch):
+    # Third objective never joins, so the leader waits for the window
+    state = _state(3)
+
+    async def _batch(*_args) -> dict[int, bool | str]:
+        raise AssertionError("Batch resolved after the leader was cancelled")
+
+    monkeypatch.setattr(think, "_should_stop_batch", _batch)
+    monkeypatch.setattr(think, "STOP_CHECK_BATCH_WINDOW", 60)
+
+    leader = asyncio.create_task(
+        think._should_stop_objective(
+            objective=state.objectives[0],
+            think=state,
+        )
+    )
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(
+        think._should_stop_objective(
+            objective=state.objectives[1],
+            think=state,
+        )
+    )
+    await asyncio.sleep(0)
+
+    # Cancel the leader while it waits for the batch
+    leader.cancel()
+
+    # Validate both are cancelled, and the next check can lead a new batch
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    with pytest.raises(asyncio.CancelledError):
+        await follower
+    assert not state.stop_checks
+
+
+@pytest.mark.asyncio
+async def test_should_stop_window(monkeypatch: pytest.MonkeyPatch):
+    state = _state(2)
+    batches: list[list[int]] = []
+
+    async def _batch(_think: ThinkState, indexes: list[int]) -> dict[int, bool | str]:
+        batches.append(indexes)
+        return {0: False, 1: "Answer"}
+
+    monkeypatch.setattr(think, "_should_stop_batch", _batch)
+    # Fail if the window is waited for, all running objectives join before
+    monkeypatch.setattr(think, "STOP_CHECK_BATCH_WINDOW", 60)
+
+    leader = asyncio.create_task(
+        think._should_stop_objective(
+            objective=state.objectives[0],
+            think=state,
+        )
+    )
+    # Join later than the same loop iteration
+    await asyncio.sleep(0.01)
+    follower = think._should_stop_objective(
+        objective=state.objectives[1],
+        think=state,
+    )
+
+    res = await asyncio.wait_for(
+        asyncio.gather(leader, follower),
+        timeout=1,
+    )
+
+    # Validate the batch is run as soon as all running objectives joined
+    assert res == [False, "Answer"]
+    assert batches == [[0, 1]]
+    assert not state.stop_checks
+
+
+@pytest.mark.asyncio
+async def test_should_stop_exception(monkeypatch: pytest.MonkeyPatch):
+    state = _state(2)
+
+    async def _batch(*_args) -> dict[int, bool | str]:
+        raise RuntimeError("Completion failed")
+
+    monkeypatch.setattr(think, "_should_stop_batch", _batch)
+
+    res = await asyncio.gather(
+        *[
+            think._should_stop_objective(
+                objective=objective,
+                think=state,
+            )
+            for objective in state.objectives
+        ],
+        return_exceptions=True,
+    )
+
+    # Validate the failure is raised to all objectives of the batch
+    assert all(isinstance(error, RuntimeError) for error in res)
+    assert not state.stop_checks
+
+
+@pytest.mark.asyncio
+async def test_close_scheduler():
+    scheduler = think.get_scheduler()
+    await think.close_scheduler()
+
+    # Validate a new scheduler is created, and can spawn objectives
+    assert think.get_scheduler() is not scheduler
+    job = await think.get_scheduler().spawn(asyncio.sleep(0))
+    await job.wait()
+    await think.close_scheduler()